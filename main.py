@@ -1,6 +1,12 @@
+import bisect
 import os
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import requests
+from requests.adapters import HTTPAdapter
 import serial
 from dotenv import load_dotenv
 from pathlib import Path
@@ -19,30 +25,77 @@ ORS_API_KEY = os.getenv("ORS_API_KEY", "").strip()
 EVENT_TARGET = os.getenv("EVENT_TARGET", "").strip()
 
 PRINT_EVERY_SEC = 1.0
+RESEND_EVERY_SEC = 5.0  # resend unchanged gauges in case the board reset
+TICK_SEC = 0.2
 WEATHER_POLL_SEC = 300
 TRAFFIC_POLL_SEC = 120
 
 def clamp100(x: float) -> int:
-    return max(0, min(100, int(round(x))))
+    # rounds half up; cheaper than max/min/round on every gauge call
+    if x <= 0:
+        return 0
+    if x >= 100:
+        return 100
+    return int(x + 0.5)
+
+# piecewise gauge curves as (xs, ys) breakpoint tables
+WATER_XS = (0.0, 1.0, 2.0, 3.0, 4.0)
+WATER_YS = (95, 70, 52, 25, 5)
+
+STAND_XS = (0.0, 25.0, 40.0)
+STAND_YS = (100, 50, 10)
+
+EVENT_XS = (0.0, 6.0, 8.0, 10.0, 12.0)
+EVENT_YS = (30, 70, 80, 85, 90)  # 10h -> 85 assumed
+
+COMMUTE_XS = (12.0, 18.0, 45.0)
+COMMUTE_YS = (100, 65, 30)
 
-def lerp(a: float, b: float, t: float) -> float:
-    return a + (b - a) * t
+def _inv_dx(xs):
+    # interp() bisects xs and never sorts, so check the order once here
+    if any(x1 <= x0 for x0, x1 in zip(xs, xs[1:])):
+        raise ValueError(f"breakpoints must be strictly increasing: {xs}")
+    return tuple(1.0 / (x1 - x0) for x0, x1 in zip(xs, xs[1:]))
 
-def piecewise_linear(x: float, points):
+WATER_INV_DX = _inv_dx(WATER_XS)
+STAND_INV_DX = _inv_dx(STAND_XS)
+EVENT_INV_DX = _inv_dx(EVENT_XS)
+COMMUTE_INV_DX = _inv_dx(COMMUTE_XS)
+
+# last segment hit per table, keyed by id(xs); inputs drift slowly tick to tick
+_LAST_SEG = {}
+
+def interp(x: float, xs, ys, inv_dx):
     """
-    points: list of (x, y) sorted by x.
+    xs, ys: breakpoint table, xs strictly increasing (not re-sorted here).
+    inv_dx: 1/(xs[i+1]-xs[i]) per segment, from _inv_dx(xs).
     clamps outside range.
     """
-    points = sorted(points, key=lambda p: p[0])
-    if x <= points[0][0]:
-        return points[0][1]
-    if x >= points[-1][0]:
-        return points[-1][1]
-    for (x0, y0), (x1, y1) in zip(points, points[1:]):
-        if x0 <= x <= x1:
-            t = (x - x0) / (x1 - x0) if x1 != x0 else 0.0
-            return lerp(y0, y1, t)
-    return points[-1][1]
+    if x <= xs[0]:
+        return ys[0]
+    if x >= xs[-1]:
+        return ys[-1]
+    key = id(xs)
+    i = _LAST_SEG.get(key, 0)
+    if not (xs[i] <= x <= xs[i + 1]):
+        i = bisect.bisect_right(xs, x) - 1
+        _LAST_SEG[key] = i
+    return ys[i] + (ys[i + 1] - ys[i]) * (x - xs[i]) * inv_dx[i]
+
+LUT_SIZE = 1024
+
+def _build_lut(xs, ys, inv_dx):
+    """
+    samples a curve starting at x=0 into LUT_SIZE clamped gauge values.
+    returns (lut, scale); look up with lut[int(x * scale + 0.5)].
+    """
+    scale = (LUT_SIZE - 1) / xs[-1]
+    return tuple(clamp100(interp(i / scale, xs, ys, inv_dx)) for i in range(LUT_SIZE)), scale
+
+# water (0-4h) and event (0-12h) are read every tick with slowly moving
+# inputs, so sample them once and index instead of interpolating
+WATER_LUT, WATER_LUT_SCALE = _build_lut(WATER_XS, WATER_YS, WATER_INV_DX)
+EVENT_LUT, EVENT_LUT_SCALE = _build_lut(EVENT_XS, EVENT_YS, EVENT_INV_DX)
 
 def parse_event_target_to_epoch(s: str) -> float:
     import datetime
@@ -53,26 +106,35 @@ def parse_event_target_to_epoch(s: str) -> float:
     dt = datetime.datetime.strptime(s, "%Y-%m-%d %H:%M")
     return dt.timestamp()
 
-def open_meteo_current(lat: float, lon: float):
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "current": "temperature_2m,weather_code,wind_speed_10m",
-        "temperature_unit": "fahrenheit",
-        "wind_speed_unit": "mph",
-    }
-    r = requests.get(url, params=params, timeout=6)
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+ORS_URL = "https://api.openrouteservice.org/v2/directions/driving-car"
+
+# one keep-alive session so each poll reuses its connection instead of
+# paying a fresh TCP + TLS handshake
+SESSION = requests.Session()
+SESSION.mount("https://api.open-meteo.com", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+SESSION.mount("https://api.openrouteservice.org", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+# request params/bodies only depend on .env, so build them once
+OPEN_METEO_PARAMS = {
+    "latitude": HOME_LAT,
+    "longitude": HOME_LON,
+    "current": "temperature_2m,weather_code,wind_speed_10m",
+    "temperature_unit": "fahrenheit",
+    "wind_speed_unit": "mph",
+}
+ORS_HEADERS = {"Authorization": ORS_API_KEY, "Content-Type": "application/json", "Accept": "application/json"}
+ORS_BODY = {"coordinates": [[HOME_LON, HOME_LAT], [DEST_LON, DEST_LAT]]}
+
+def open_meteo_current():
+    r = SESSION.get(OPEN_METEO_URL, params=OPEN_METEO_PARAMS, timeout=6)
     r.raise_for_status()
     j = r.json()
     cur = j.get("current", {})
     return float(cur.get("temperature_2m", 0.0)), int(cur.get("weather_code", 0)), float(cur.get("wind_speed_10m", 0.0))
 
-def ors_route_minutes(o_lat, o_lon, d_lat, d_lon, api_key: str) -> float:
-    url = "https://api.openrouteservice.org/v2/directions/driving-car"
-    headers = {"Authorization": api_key, "Content-Type": "application/json", "Accept": "application/json"}
-    body = {"coordinates": [[o_lon, o_lat], [d_lon, d_lat]]}
-    r = requests.post(url, json=body, headers=headers, timeout=8)
+def ors_route_minutes() -> float:
+    r = SESSION.post(ORS_URL, json=ORS_BODY, headers=ORS_HEADERS, timeout=8)
     r.raise_for_status()
     j = r.json()
     seconds = float(j["features"][0]["properties"]["summary"]["duration"])
@@ -80,28 +142,31 @@ def ors_route_minutes(o_lat, o_lon, d_lat, d_lon, api_key: str) -> float:
 
 
 
+WMO_KIND_CODES = {
+    "sunny": (0,),
+    "cloudy": (1, 2, 3, 45, 48),
+    "thunder": (95,),
+    "severe": (96, 99),
+    "snow": (71, 73, 75, 77, 85, 86),
+    "rain": (51, 53, 55, 56, 57, 61, 63, 65, 66, 67, 80, 81, 82),
+}
+
+# WMO codes are 0..99, so a flat tuple indexed by code beats walking the table
+_WCODE_KIND = tuple(
+    next((k for k, codes in WMO_KIND_CODES.items() if c in codes), "cloudy")
+    for c in range(100)
+)
+
+# wmo_to_kind, weather_value, temp_value and commute_value only see new
+# inputs when a poll lands (every 2-5 min), so ticks in between are
+# served from the C-level lru_cache instead of re-running the body
+@lru_cache(maxsize=16)
 def wmo_to_kind(wcode: int, wind_mph: float) -> str:
-    
-    if wcode == 0:
-        kind = "sunny"
-    elif wcode in (1, 2, 3, 45, 48):
-        kind = "cloudy"
-    elif wcode in (95, 96, 99):
-        kind = "thunder"
-    elif wcode in (71, 73, 75, 77, 85, 86):
-        kind = "snow"
-    elif wcode in (51, 53, 55, 56, 57, 61, 63, 65, 66, 67, 80, 81, 82):
-        kind = "rain"
-    else:
-        kind = "cloudy"
-
-    # wind overrideeeee
-    if wind_mph >= 20 and kind not in ("thunder",):
-        kind = "wind"
+    kind = _WCODE_KIND[wcode] if 0 <= wcode < 100 else "cloudy"
 
-    # severe overrideeee
-    if wcode in (96, 99):
-        kind = "severe"
+    # wind overrideeeee (severe already wins in the table)
+    if wind_mph >= 20 and kind not in ("thunder", "severe"):
+        kind = "wind"
 
     return kind
 
@@ -115,81 +180,101 @@ WEATHER_TICKS = {
     "severe": 10,
 }
 
+@lru_cache(maxsize=16)
 def weather_value(kind: str) -> int:
     return clamp100(WEATHER_TICKS.get(kind, 75))
 
+@lru_cache(maxsize=16)
 def temp_value(temp_f: float) -> int:
    
     return clamp100(100.0 - temp_f)
 
-def water_value(last_water_ts: float) -> int:
+def water_value(hours: float) -> int:
     
-    hours = (time.time() - last_water_ts) / 3600.0
     if hours >= 4.0:
         return 5
-    y = piecewise_linear(hours, [
-        (0.0, 95),
-        (1.0, 70),
-        (2.0, 52),
-        (3.0, 25),
-        (4.0, 5),
-    ])
-    return clamp100(y)
+    if hours <= 0:
+        return WATER_LUT[0]
+    return WATER_LUT[int(hours * WATER_LUT_SCALE + 0.5)]
 
-def stand_value(stand_ms: float, total_ms: float) -> int:
+def stand_value(pct: float) -> int:
   
-    if total_ms <= 0:
-        return 100
-    pct = (stand_ms / total_ms) * 100.0
-    pct = max(0.0, min(40.0, pct)) 
-    y = piecewise_linear(pct, [
-        (0.0, 100),
-        (25.0, 50),
-        (40.0, 10),
-    ])
+    pct = max(0.0, min(40.0, pct))
+    y = interp(pct, STAND_XS, STAND_YS, STAND_INV_DX)
     return clamp100(y)
 
-def event_value(seconds_left: float) -> int:
+def event_value(h: float) -> int:
    
-    h = seconds_left / 3600.0
     if h <= 0:
         return 30
     if h >= 12:
         return 90
 
-    y = piecewise_linear(h, [
-        (0.0, 30),
-        (6.0, 70),
-        (8.0, 80),
-        (10.0, 85),   # assumed
-        (12.0, 90),
-    ])
-    return clamp100(y)
+    return EVENT_LUT[int(h * EVENT_LUT_SCALE + 0.5)]
 
+@lru_cache(maxsize=16)
 def commute_value(minutes: float) -> int:
 
     minutes = max(12.0, min(45.0, minutes))
-    y = piecewise_linear(minutes, [
-        (12.0, 100),
-        (18.0, 65),
-        (45.0, 30),
-    ])
+    y = interp(minutes, COMMUTE_XS, COMMUTE_YS, COMMUTE_INV_DX)
     return clamp100(y)
 
+def gauge_values(kind: str, temp_f: float, water_h: float, stand_pct: float, event_h: float, commute_min: float):
+    """
+    all six gauges in one call, in the order the sketch expects:
+    weather, temp, water, stand, event, commute.
+    """
+    return (
+        weather_value(kind),
+        temp_value(temp_f),
+        water_value(water_h),
+        stand_value(stand_pct),
+        event_value(event_h),
+        commute_value(commute_min),
+    )
+
+
+# event_short only changes once a minute / every 0.1h, so cache the strings
+@lru_cache(maxsize=32)
+def _fmt_minutes(mins: int) -> str:
+    return f"{mins}m"
+
+@lru_cache(maxsize=32)
+def _fmt_hours(tenths: int) -> str:
+    return f"{tenths / 10:.1f}h"
 
 def event_short(seconds_left: float) -> str:
     if seconds_left <= 0:
         return "NOW"
     mins = seconds_left / 60.0
     if mins < 60:
-        return f"{int(round(mins))}m"
-    hrs = mins / 60.0
-    return f"{hrs:.1f}h"
+        return _fmt_minutes(int(round(mins)))
+    return _fmt_hours(int(round(mins / 6.0)))
 
 def send_update(ser: serial.Serial, vals):
     
-    msg = "U," + ",".join(str(clamp100(v)) for v in vals) + "\n"
-    ser.write(msg.encode("utf-8"))
+    # gauge values are already clamped ints; vals is the 6-tuple from gauge_values
+    ser.write(b"U,%d,%d,%d,%d,%d,%d\n" % vals)
+
+def serial_reader(ser: serial.Serial, events: queue.Queue):
+    # wait for a byte (bounded by the port timeout), then take everything
+    # already buffered in one read and split it into lines; a partial
+    # trailing line is kept until the rest of it arrives
+    pending = b""
+    try:
+        while ser.is_open:
+            buf = ser.read(ser.in_waiting or 1)
+            if not buf:
+                continue
+            *lines, pending = (pending + buf).split(b"\n")
+            for line in lines:
+                line = line.strip()
+                if line:
+                    events.put(line)
+            if len(pending) > 200:
+                pending = b""  # no newline in sight, drop it like the sketch does
+    except serial.SerialException:
+        pass  # port closed under us on shutdown
 
 def main():
     if not PORT:
@@ -199,25 +284,44 @@ def main():
 
     event_target_epoch = parse_event_target_to_epoch(EVENT_TARGET)
 
-    last_water_ts = time.time()
+    # interval/elapsed bookkeeping is on the monotonic clock so NTP or DST
+    # jumps can't skip polls or corrupt stand time; only the event
+    # countdown (a wall-clock target) uses time.time()
+    last_water_ts = time.monotonic()
 
     standing = False
     stand_ms = 0.0
     total_ms = 0.0
-    last_state_ts = time.time()
+    last_state_ts = time.monotonic()
 
     temp_f, wcode, wind_mph = 50.0, 3, 0.0
     commute_min = 18.0
 
-    last_weather_poll = 0.0
-    last_traffic_poll = 0.0
-    last_print = 0.0
+    last_weather_poll = float("-inf")
+    last_traffic_poll = float("-inf")
+    last_print = float("-inf")
+    last_send = float("-inf")
+    last_vals = None
 
-    with serial.Serial(PORT, BAUD, timeout=0.05) as ser:
+    # in-flight HTTP polls; they run on a worker pool so a slow network
+    # never stalls the serial/gauge loop
+    weather_job = None
+    traffic_job = None
+
+    with serial.Serial(PORT, BAUD, timeout=TICK_SEC) as ser, ThreadPoolExecutor(max_workers=2) as pool:
         time.sleep(2)
 
+        events = queue.Queue()
+        threading.Thread(target=serial_reader, args=(ser, events), daemon=True).start()
+        next_tick = time.monotonic()
+
         while True:
-            now = time.time()
+            # sleep until the next gauge tick or the next serial event
+            try:
+                line = events.get(timeout=max(0.0, next_tick - time.monotonic()))
+            except queue.Empty:
+                line = b""
+            now = time.monotonic()
 
             # accumulate sit/stand time
             dt = now - last_state_ts
@@ -227,64 +331,65 @@ def main():
                     stand_ms += dt * 1000.0
             last_state_ts = now
 
-        #drain
-            while ser.in_waiting:
-                line = ser.readline().decode(errors="ignore").strip()
-                if not line:
-                    break
-                if line == "B,WATER":
-                    last_water_ts = time.time()
+            # button/switch events from the board, matched as raw bytes
+            if line:
+                if line == b"B,WATER":
+                    last_water_ts = now
                     print("WATER RESET")
-                elif line.startswith("S,"):
-                    standing = line.endswith("1")
+                elif line[:2] == b"S,":
+                    standing = line[-1:] == b"1"
                     print("STAND STATE =", "STAND" if standing else "SIT")
 
-            # poll weather
-            if now - last_weather_poll > WEATHER_POLL_SEC:
+            if now < next_tick:
+                continue
+            next_tick = now + TICK_SEC
+
+            # poll weather in the background, pick up the result once it lands
+            if weather_job is None and now - last_weather_poll > WEATHER_POLL_SEC:
+                weather_job = pool.submit(open_meteo_current)
+                last_weather_poll = now
+            if weather_job is not None and weather_job.done():
                 try:
-                    temp_f, wcode, wind_mph = open_meteo_current(HOME_LAT, HOME_LON)
+                    temp_f, wcode, wind_mph = weather_job.result()
                 except Exception:
                     pass
-                last_weather_poll = now
+                weather_job = None
 
-            # poll commute
-            if now - last_traffic_poll > TRAFFIC_POLL_SEC:
+            # poll commute, same deal
+            if traffic_job is None and now - last_traffic_poll > TRAFFIC_POLL_SEC:
                 if ORS_API_KEY:
-                    try:
-                        commute_min = ors_route_minutes(HOME_LAT, HOME_LON, DEST_LAT, DEST_LON, ORS_API_KEY)
-                    except Exception:
-                        pass
+                    traffic_job = pool.submit(ors_route_minutes)
                 last_traffic_poll = now
+            if traffic_job is not None and traffic_job.done():
+                try:
+                    commute_min = traffic_job.result()
+                except Exception:
+                    pass
+                traffic_job = None
 
             kind = wmo_to_kind(wcode, wind_mph)
 
-            g_weather = weather_value(kind)
-            g_temp    = temp_value(temp_f)
-            g_water   = water_value(last_water_ts)
-            g_stand   = stand_value(stand_ms, total_ms)
-
-            seconds_left = event_target_epoch - now
-            g_event   = event_value(seconds_left)
-            g_comm    = commute_value(commute_min)
+            water_h = (now - last_water_ts) / 3600.0
+            stand_pct = 0.0 if total_ms <= 0 else (stand_ms / total_ms) * 100.0
+            seconds_left = event_target_epoch - time.time()
 
-            vals = [g_weather, g_temp, g_water, g_stand, g_event, g_comm]
-            send_update(ser, vals)
+            vals = gauge_values(kind, temp_f, water_h, stand_pct, seconds_left / 3600.0, commute_min)
+            if vals != last_vals or now - last_send >= RESEND_EVERY_SEC:
+                send_update(ser, vals)
+                last_vals = vals
+                last_send = now
 
             if now - last_print >= PRINT_EVERY_SEC:
-                water_h = min(4.0, (time.time() - last_water_ts) / 3600.0)
-                stand_pct = 0.0 if total_ms <= 0 else (stand_ms / total_ms) * 100.0
-
+                g_weather, g_temp, g_water, g_stand, g_event, g_comm = vals
                 print(
                     f"WX {kind} -> {g_weather} | "
                     f"TEMP {temp_f:.0f}F -> {g_temp} | "
-                    f"WATER {water_h:.2f}h -> {g_water} | "
+                    f"WATER {min(4.0, water_h):.2f}h -> {g_water} | "
                     f"STAND {stand_pct:.1f}% -> {g_stand} | "
                     f"EVENT {event_short(seconds_left)} -> {g_event} | "
                     f"COMMUTE {commute_min:.0f}m -> {g_comm}"
                 )
                 last_print = now
 
-            time.sleep(0.2)
-
 if __name__ == "__main__":
     main()